@@ -6,14 +6,49 @@ This script simulates an IoT gateway that collects data from various energy-rela
 and publishes it to an MQTT broker, which is part of a Microgrid Energy Management System.
 """
 
-import json
+import math
 import random
+import socket
 import time
 from datetime import datetime
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 import argparse
 import logging
 import uuid
+from functools import lru_cache
+
+try:
+    from orjson import dumps
+except ImportError:
+    try:
+        import ujson
+
+        def dumps(obj):
+            """Serialize obj to compact UTF-8 JSON bytes (orjson fallback)"""
+            return ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+    except ImportError:
+        import json
+
+        def dumps(obj):
+            """Serialize obj to compact UTF-8 JSON bytes (orjson fallback)"""
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Configure logging
 logging.basicConfig(
@@ -26,6 +61,19 @@ logger = logging.getLogger("IoT_Gateway_Simulator")
 DEFAULT_BROKER_HOST = "localhost"
 DEFAULT_BROKER_PORT = 1883
 DEFAULT_QOS = 1
+# High-rate telemetry is fire-and-forget, batches keep DEFAULT_QOS
+TELEMETRY_QOS = 0
+CONNECT_TIMEOUT = 10
+# Reconnect backoff in seconds, doubling after each failed attempt (paho's loop_start() defaults)
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 120
+SOCKET_SNDBUF = 1 << 20
+# Persistent session and flow-control window for QoS 1 traffic
+SESSION_EXPIRY = 3600
+MAX_INFLIGHT_MESSAGES = 1000
+MAX_QUEUED_MESSAGES = 100_000
+# Batches smaller than this are sent uncompressed, zstd framing would not pay off
+COMPRESS_MIN_BYTES = 512
 
 class SensorType:
     TEMPERATURE = "temperature"
@@ -38,82 +86,254 @@ class SensorType:
     WIND_SPEED = "wind_speed"
     BATTERY_LEVEL = "battery_level"
 
-class IoTGatewaySimulator:
-    def __init__(self, broker_host, broker_port, num_sensors=10, gateway_id=None):
+# Reading ranges keyed by sensor type, in fixed point: (low, high, scale, unit).
+# A raw value v stands for v / scale units, so readings never need rounding.
+SENSOR_SPECS = {
+    # Temperature in Celsius
+    SensorType.TEMPERATURE: (1800, 3000, 100, "°C"),
+    # Humidity as percentage
+    SensorType.HUMIDITY: (3000, 7000, 100, "%"),
+    # Voltage in volts
+    SensorType.VOLTAGE: (2200, 2400, 10, "V"),
+    # Current in amperes
+    SensorType.CURRENT: (50, 1500, 100, "A"),
+    # Power in watts
+    SensorType.POWER: (10000, 500000, 100, "W"),
+    # Energy in kilowatt-hours
+    SensorType.ENERGY: (100, 50000, 1000, "kWh"),
+    # Solar irradiance in watts per square meter, as noise around the time-of-day baseline
+    SensorType.SOLAR_IRRADIANCE: (-5000, 5000, 100, "W/m²"),
+    # Wind speed in meters per second
+    SensorType.WIND_SPEED: (0, 1500, 100, "m/s"),
+    # Battery level as percentage
+    SensorType.BATTERY_LEVEL: (200, 950, 10, "%"),
+}
+GENERIC_SPEC = (0, 10000, 100, "units")
+
+# Sensor types whose individual readings are published with acknowledged delivery
+SENSOR_QOS = {
+    SensorType.ENERGY: 1,
+    SensorType.BATTERY_LEVEL: 1,
+}
+
+# Below this many sensors, NumPy call overhead outweighs vectorized generation
+VECTORIZE_MIN_SENSORS = 32
+
+# Number of pre-drawn uniform draws shared by all per-sensor generators, a power of two
+NOISE_RING_SIZE = 1 << 16
+
+@lru_cache(maxsize=None)
+def _solar_base(hour, scale):
+    """Raw baseline solar irradiance for the given hour and scale, or None at night (cached)"""
+    # Simulate day/night cycle
+    if 6 <= hour <= 18:
+        return round(600 * math.sin(math.pi * (hour - 6) / 12) * scale)
+    return None
+
+@lru_cache(maxsize=1)
+def _fill_kernel():
+    """Numba kernel filling out with one raw fixed-point reading per sensor, or None without Numba"""
+    # Imported and compiled on first use, so gateways that never take the vectorized path
+    # pay neither the import nor the JIT compilation
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+        
+    @njit(parallel=True, fastmath=True, cache=True)
+    def fill_values(lo, hi, solar, solar_base, out):
+        for i in prange(out.shape[0]):
+            value = lo[i] + np.int64((hi[i] - lo[i] + 1) * np.random.random())
+            if solar[i]:
+                value = max(0, solar_base + value) if solar_base >= 0 else 0
+            out[i] = value
+            
+    # Compile now rather than in the first publish tick
+    ints = np.zeros(1, dtype=np.int64)
+    fill_values(ints, ints, np.zeros(1, dtype=np.bool_), -1, np.empty(1, dtype=np.int64))
+    return fill_values
+
+@lru_cache(maxsize=1)
+def _noise_ring():
+    """Pre-drawn uniform draws in [0, 1), drawn once and shared by every generator"""
+    if np is not None:
+        return np.random.default_rng().random(NOISE_RING_SIZE).tolist()
+    rand = random.Random()
+    return [rand.random() for _ in range(NOISE_RING_SIZE)]
+
+def _ring_draw(spec, rand):
+    """Build a function returning the next raw value in [lo, hi] of spec from the shared noise ring"""
+    noise = _noise_ring()
+    lo, span = spec[0], spec[1] - spec[0] + 1
+    mask = NOISE_RING_SIZE - 1
+    # A random start and odd stride give each generator its own walk over the whole ring,
+    # rather than every gateway replaying the same sequence
+    index = rand.randrange(NOISE_RING_SIZE)
+    stride = rand.randrange(1, NOISE_RING_SIZE, 2)
+    
+    def draw():
+        nonlocal index
+        index = (index + stride) & mask
+        return lo + int(span * noise[index])
+    return draw
+
+def _solar_generator(rand):
+    """Build a solar irradiance generator, in watts per square meter"""
+    spec = SENSOR_SPECS[SensorType.SOLAR_IRRADIANCE]
+    scale = spec[2]
+    noise = _ring_draw(spec, rand)
+    
+    def generate():
+        base = _solar_base(datetime.now().hour, scale)
+        if base is None:
+            return 0
+        return max(0, base + noise())
+    return generate
+
+def _build_reading_generators(rand):
+    """Reading generators keyed by sensor type, each returning a raw fixed-point value"""
+    generators = {
+        sensor_type: _ring_draw(spec, rand) for sensor_type, spec in SENSOR_SPECS.items()
+    }
+    generators[SensorType.SOLAR_IRRADIANCE] = _solar_generator(rand)
+    return generators
+
+class PayloadCodec:
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+# The reading dict published by each codec, with scale and unit inlined as constants: JSON
+# converts the raw fixed-point value to units, msgpack keeps it raw alongside its scale
+_READING_TEMPLATES = {
+    PayloadCodec.JSON: "{{'timestamp': timestamp, 'value': {value} / {scale!r}, 'unit': {unit!r}}}",
+    PayloadCodec.MSGPACK: "{{'timestamp': timestamp, 'value': {value}, 'scale': {scale!r}, 'unit': {unit!r}}}",
+}
+
+@lru_cache(maxsize=None)
+def _reader_code(codec, scale, unit, sampling):
+    """Compiled reading function source for a codec, scale and unit (cached)"""
+    # Sampling readers draw their own value, the others are handed one by vectorized generation
+    if sampling:
+        signature, value = "timestamp, next_value=next_value", "next_value()"
+    else:
+        signature, value = "timestamp, value", "value"
+    body = _READING_TEMPLATES[codec].format(value=value, scale=scale, unit=unit)
+    source = f"def read({signature}):\n    return {body}\n"
+    return compile(source, f"<{codec} reader {scale} {unit}>", "exec")
+
+def _compile_reader(codec, scale, unit, next_value=None):
+    """Build a specialized reading function: read(timestamp) drawing from next_value, or
+    read(timestamp, value) when next_value is None"""
+    namespace = {"next_value": next_value}
+    exec(_reader_code(codec, scale, unit, next_value is not None), namespace)
+    return namespace["read"]
+
+class SharedMqttTransport:
+    """A single MQTT connection and network loop shared by any number of simulated gateways"""
+    
+    def __init__(self, broker_host, broker_port, client_id=None, mqtt_v5=False, persistent_session=None):
         self.broker_host = broker_host
         self.broker_port = broker_port
-        self.gateway_id = gateway_id or f"gateway-{uuid.uuid4().hex[:8]}"
+        self.client_id = client_id or f"iot-gateway-fleet-{uuid.uuid4().hex[:8]}"
+        self.mqtt_v5 = mqtt_v5
+        # A session can only be resumed under the same client ID, so a random one gets a clean session
+        self.persistent_session = client_id is not None if persistent_session is None else persistent_session
         self.client = None
         self.connected = False
-        self.num_sensors = num_sensors
-        self.sensors = self._create_sensors(num_sensors)
+        self.gateways = []
+        # MQTT v5 topic aliases are per connection, negotiated in CONNACK
+        self._topic_alias_max = 0
+        self._alias_sent = set()
+        self._next_alias = 1
+        self._connect_refused = False
+        self._reconnect_delay = RECONNECT_MIN_DELAY
+        self._next_reconnect = 0.0
         
-    def _create_sensors(self, num_sensors):
-        """Create a collection of simulated sensors"""
-        sensors = []
+    def add_gateway(self, gateway, num_aliases):
+        """Attach a gateway and reserve a block of topic aliases for it, returning the first one"""
+        self.gateways.append(gateway)
+        first_alias = self._next_alias
+        self._next_alias += num_aliases
+        return first_alias
         
-        # Ensure at least one of each important sensor type
-        sensor_types = [
-            SensorType.TEMPERATURE,
-            SensorType.HUMIDITY,
-            SensorType.VOLTAGE,
-            SensorType.CURRENT,
-            SensorType.POWER,
-            SensorType.ENERGY,
-            SensorType.SOLAR_IRRADIANCE,
-            SensorType.WIND_SPEED,
-            SensorType.BATTERY_LEVEL
-        ]
-        
-        # Add core sensor types
-        for i, sensor_type in enumerate(sensor_types):
-            if i >= num_sensors:
-                break
-                
-            sensors.append({
-                "id": f"sensor-{i+1}",
-                "type": sensor_type,
-                "location": f"zone-{(i % 3) + 1}"
-            })
-        
-        # Add additional random sensors if needed
-        for i in range(len(sensor_types), num_sensors):
-            sensor_type = random.choice(sensor_types)
-            sensors.append({
-                "id": f"sensor-{i+1}",
-                "type": sensor_type,
-                "location": f"zone-{(i % 3) + 1}"
-            })
-            
-        return sensors
-    
     def connect(self):
-        """Connect to the MQTT broker"""
-        self.client = mqtt.Client(client_id=f"iot-gateway-{self.gateway_id}")
+        """Connect to the MQTT broker and wait for it to accept the connection"""
+        if self.connected:
+            # Gateways sharing this transport may each call connect(), the first one wins
+            return True
+        if self.client is not None:
+            # Release the socket of an earlier, failed attempt before replacing its client
+            sock = self.client.socket()
+            if sock is not None:
+                sock.close()
+                
+        # Keep the broker-side session across reconnects so in-flight QoS 1 messages resume
+        connect_kwargs = {}
+        if self.mqtt_v5:
+            self.client = mqtt.Client(client_id=self.client_id, protocol=mqtt.MQTTv5)
+            if self.persistent_session:
+                connect_properties = Properties(PacketTypes.CONNECT)
+                connect_properties.SessionExpiryInterval = SESSION_EXPIRY
+                connect_kwargs = {"clean_start": False, "properties": connect_properties}
+            else:
+                connect_kwargs = {"clean_start": True}
+        else:
+            self.client = mqtt.Client(
+                client_id=self.client_id, clean_session=not self.persistent_session, protocol=mqtt.MQTTv311
+            )
+        self.client.max_inflight_messages_set(MAX_INFLIGHT_MESSAGES)
+        self.client.max_queued_messages_set(MAX_QUEUED_MESSAGES)
         
         # Set up callbacks
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
         self.client.on_publish = self._on_publish
+        self._connect_refused = False
+        self._reconnect_delay = RECONNECT_MIN_DELAY
+        self._schedule_reconnect()
         
         try:
             logger.info(f"Connecting to MQTT broker at {self.broker_host}:{self.broker_port}")
-            self.client.connect(self.broker_host, self.broker_port, 60)
-            self.client.loop_start()
-            return True
+            self.client.connect(self.broker_host, self.broker_port, 60, **connect_kwargs)
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
             return False
+            
+        # There is no background loop thread, so the CONNACK has to be read from here
+        if not self._wait_for_connection():
+            if not self._connect_refused:
+                logger.error("Timed out waiting for the broker to accept the connection")
+            return False
+        return True
     
-    def _on_connect(self, client, userdata, flags, rc):
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback for when the client connects to the broker"""
         if rc == 0:
             self.connected = True
+            self._connect_refused = False
+            self._reconnect_delay = RECONNECT_MIN_DELAY
+            self._tune_socket()
+            self._alias_sent.clear()
+            self._topic_alias_max = getattr(properties, "TopicAliasMaximum", 0) if properties else 0
             logger.info("Connected to MQTT broker successfully")
         else:
+            self._connect_refused = True
             logger.error(f"Failed to connect to broker with result code {rc}")
     
-    def _on_disconnect(self, client, userdata, rc):
+    def _tune_socket(self):
+        """Disable Nagle's algorithm and enlarge the send buffer on the broker connection"""
+        # Done on every (re)connect since paho opens a new socket each time
+        sock = self.client.socket()
+        if sock is None:
+            return
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SNDBUF)
+        except (OSError, AttributeError) as e:
+            # AttributeError covers websocket transports, which wrap the TCP socket
+            logger.warning(f"Could not tune MQTT socket options: {e}")
+    
+    def _on_disconnect(self, client, userdata, rc, properties=None):
         """Callback for when the client disconnects from the broker"""
         self.connected = False
         if rc != 0:
@@ -123,123 +343,119 @@ class IoTGatewaySimulator:
     
     def _on_publish(self, client, userdata, mid):
         """Callback for when a message is published"""
-        logger.debug(f"Message {mid} published")
-        
-    def _generate_sensor_reading(self, sensor):
-        """Generate realistic sensor data based on sensor type"""
-        reading = {"timestamp": datetime.now().isoformat()}
+        logger.debug("Message %s published", mid)
         
-        if sensor["type"] == SensorType.TEMPERATURE:
-            # Temperature in Celsius
-            reading["value"] = round(random.uniform(18.0, 30.0), 2)
-            reading["unit"] = "°C"
-            
-        elif sensor["type"] == SensorType.HUMIDITY:
-            # Humidity as percentage
-            reading["value"] = round(random.uniform(30.0, 70.0), 2)
-            reading["unit"] = "%"
-            
-        elif sensor["type"] == SensorType.VOLTAGE:
-            # Voltage in volts
-            reading["value"] = round(random.uniform(220.0, 240.0), 1)
-            reading["unit"] = "V"
+    def aliased_topic(self, topic, alias, properties):
+        """Topic and publish properties to use, with an MQTT v5 topic alias when the broker allows it"""
+        if alias > self._topic_alias_max:
+            return topic, None
             
-        elif sensor["type"] == SensorType.CURRENT:
-            # Current in amperes
-            reading["value"] = round(random.uniform(0.5, 15.0), 2)
-            reading["unit"] = "A"
-            
-        elif sensor["type"] == SensorType.POWER:
-            # Power in watts
-            reading["value"] = round(random.uniform(100.0, 5000.0), 2)
-            reading["unit"] = "W"
-            
-        elif sensor["type"] == SensorType.ENERGY:
-            # Energy in kilowatt-hours
-            reading["value"] = round(random.uniform(0.1, 50.0), 3)
-            reading["unit"] = "kWh"
-            
-        elif sensor["type"] == SensorType.SOLAR_IRRADIANCE:
-            # Solar irradiance in watts per square meter
-            hour = datetime.now().hour
-            # Simulate day/night cycle
-            if 6 <= hour <= 18:
-                base = 600 * math.sin(math.pi * (hour - 6) / 12)
-                reading["value"] = round(max(0, base + random.uniform(-50, 50)), 2)
-            else:
-                reading["value"] = 0.0
-            reading["unit"] = "W/m²"
-            
-        elif sensor["type"] == SensorType.WIND_SPEED:
-            # Wind speed in meters per second
-            reading["value"] = round(random.uniform(0.0, 15.0), 2)
-            reading["unit"] = "m/s"
-            
-        elif sensor["type"] == SensorType.BATTERY_LEVEL:
-            # Battery level as percentage
-            reading["value"] = round(random.uniform(20.0, 95.0), 1)
-            reading["unit"] = "%"
-            
-        else:
-            # Generic sensor
-            reading["value"] = round(random.uniform(0.0, 100.0), 2)
-            reading["unit"] = "units"
-            
-        return reading
+        # The first publish binds the alias, later ones send an empty topic
+        if alias in self._alias_sent:
+            return "", properties
+        self._alias_sent.add(alias)
+        return topic, properties
         
-    def publish_sensor_data(self):
-        """Publish data for all sensors to the MQTT broker"""
-        if not self.connected:
-            logger.error("Not connected to MQTT broker. Cannot publish data.")
-            return False
-            
-        for sensor in self.sensors:
-            reading = self._generate_sensor_reading(sensor)
-            
-            # Build complete message
-            message = {
-                "gateway_id": self.gateway_id,
-                "sensor_id": sensor["id"],
-                "sensor_type": sensor["type"],
-                "location": sensor["location"],
-                "reading": reading
-            }
+    def publish(self, topic, payload, qos, properties=None, log_payload=False):
+        """Publish a single payload, logging rather than raising on failure"""
+        try:
+            if log_payload:
+                logger.debug("Publishing to %s: %s", topic, payload)
+            result = self.client.publish(topic, payload, qos=qos, properties=properties)
+            if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                logger.error(f"Failed to publish message to {topic}: {result.rc}")
+        except Exception as e:
+            logger.error(f"Error publishing message: {e}")
+        
+    def _service_network(self, deadline):
+        """Drive the MQTT network loop from this thread until the given time.monotonic() deadline"""
+        while True:
+            remaining = max(deadline - time.monotonic(), 0)
             
-            # Build topic path
-            topic = f"iot/gateway/{self.gateway_id}/sensors/{sensor['type']}/{sensor['id']}"
+            # Publishes are written straight to the socket by the calling thread,
+            # this only has to read acks, send keepalives and flush leftover output
+            rc = self.client.loop(timeout=min(remaining, 1.0))
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                # Unlike loop_start(), loop() does not reconnect by itself
+                self._reconnect(deadline)
+                    
+            if time.monotonic() >= deadline:
+                return
+                
+    def _reconnect(self, deadline):
+        """Reconnect to the broker, backing off while attempts fail to get the connection accepted"""
+        now = time.monotonic()
+        if now < self._next_reconnect:
+            # Wait out the backoff, but not past the caller's deadline
+            time.sleep(max(min(self._next_reconnect, deadline) - now, 0))
+            return
             
-            # Convert message to JSON and publish
-            payload = json.dumps(message)
+        self._schedule_reconnect()
+        try:
+            self.client.reconnect()
+        except Exception as e:
+            logger.warning(f"Reconnect to MQTT broker failed: {e}")
             
-            try:
-                logger.debug(f"Publishing to {topic}: {payload}")
-                result = self.client.publish(topic, payload, qos=DEFAULT_QOS)
-                if result.rc != mqtt.MQTT_ERR_SUCCESS:
-                    logger.error(f"Failed to publish message to {topic}: {result.rc}")
-            except Exception as e:
-                logger.error(f"Error publishing message: {e}")
-                
-        return True
+    def _schedule_reconnect(self):
+        """Record a connection attempt, pushing back the earliest next one"""
+        # Doubled on every attempt and only reset by an accepted CONNACK, so a broker that
+        # refuses or drops connections is retried at a decreasing rate
+        self._next_reconnect = time.monotonic() + self._reconnect_delay
+        self._reconnect_delay = min(self._reconnect_delay * 2, RECONNECT_MAX_DELAY)
+                    
+    def service(self, timeout=0):
+        """Process pending network traffic (acks, keepalives, reconnects) for up to timeout seconds
+        
+        The transport has no background loop thread: run() does this between ticks, callers
+        publishing on their own schedule must call it regularly instead.
+        """
+        if self.client is None:
+            return
+        self._service_network(time.monotonic() + timeout)
+        
+    def _wait_for_connection(self, timeout=CONNECT_TIMEOUT):
+        """Run the network loop until the broker accepts or refuses the connection"""
+        deadline = time.monotonic() + timeout
+        while not self.connected and not self._connect_refused and time.monotonic() < deadline:
+            self._service_network(time.monotonic() + 0.1)
+        return self.connected
+        
+    def publish_all(self):
+        """Publish data for every attached gateway over the shared connection"""
+        # One pass for the whole fleet, rather than one per gateway in publish_sensor_data()
+        self.service()
+        published = False
+        for gateway in self.gateways:
+            published = gateway._publish_readings() or published
+        return published
         
     def run(self, interval=5, duration=None):
         """Run the simulator for a specified duration or indefinitely"""
-        logger.info(f"Starting IoT Gateway simulator with {len(self.sensors)} sensors")
+        num_sensors = sum(len(gateway.sensors) for gateway in self.gateways)
+        logger.info(f"Starting IoT Gateway simulator with {len(self.gateways)} gateway(s) and {num_sensors} sensors")
         logger.info(f"Publishing data every {interval} seconds")
         
         if duration:
             logger.info(f"Simulator will run for {duration} seconds")
-            end_time = time.time() + duration
+            end_time = time.monotonic() + duration
         else:
             logger.info("Simulator will run until interrupted")
             end_time = None
             
         try:
             count = 0
-            while end_time is None or time.time() < end_time:
-                if self.publish_sensor_data():
+            # Ticks are scheduled on absolute deadlines so publish time does not stretch the period
+            next_tick = time.monotonic()
+            while end_time is None or time.monotonic() < end_time:
+                next_tick += interval
+                if self.publish_all():
                     count += 1
                     logger.info(f"Published sensor data batch #{count}")
-                time.sleep(interval)
+                    
+                if next_tick <= time.monotonic():
+                    logger.warning(f"Publishing overran the {interval} second interval, resynchronizing")
+                    next_tick = time.monotonic()
+                self._service_network(next_tick)
                 
         except KeyboardInterrupt:
             logger.info("Simulator interrupted by user")
@@ -249,10 +465,296 @@ class IoTGatewaySimulator:
     def disconnect(self):
         """Disconnect from the MQTT broker"""
         if self.client and self.connected:
-            self.client.loop_stop()
             self.client.disconnect()
             logger.info("Disconnected from MQTT broker")
 
+class IoTGatewaySimulator:
+    def __init__(self, broker_host, broker_port, num_sensors=10, gateway_id=None,
+                 codec=PayloadCodec.JSON, batch=False, mqtt_v5=False, transport=None, compress=False):
+        if codec == PayloadCodec.MSGPACK and msgpack is None:
+            raise ValueError("The msgpack codec requires the 'msgpack' package")
+        if compress and not batch:
+            raise ValueError("Compression only applies to batches, it requires batch=True")
+        if compress and zstandard is None:
+            raise ValueError("Batch compression requires the 'zstandard' package")
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.gateway_id = gateway_id or f"gateway-{uuid.uuid4().hex[:8]}"
+        self.codec = codec
+        # A long-lived Packer reuses its internal buffer, unlike msgpack.packb
+        self._packer = msgpack.Packer(use_bin_type=True) if codec == PayloadCodec.MSGPACK else None
+        self.batch = batch
+        # Gateways attached to a shared transport use its connection (broker_host/port are ignored)
+        self.transport = transport or SharedMqttTransport(
+            broker_host, broker_port, client_id=f"iot-gateway-{self.gateway_id}", mqtt_v5=mqtt_v5,
+            persistent_session=gateway_id is not None
+        )
+        self.mqtt_v5 = self.transport.mqtt_v5
+        self._alias_base = self.transport.add_gateway(self, num_sensors)
+        self.num_sensors = num_sensors
+        self._rand = random.Random()
+        self._generators = _build_reading_generators(self._rand)
+        self._generic_generator = _ring_draw(GENERIC_SPEC, self._rand)
+        self._build_payload_templates()
+        self.sensors = self._create_sensors(num_sensors)
+        self._build_batch_prefix()
+        self._rng = None
+        if np is not None:
+            self._rng = np.random.default_rng()
+            self._build_sensor_arrays()
+        self.batch_topic = self._codec_topic(f"iot/gateway/{self.gateway_id}/sensors/batch")
+        self.compressed_batch_topic = self.batch_topic + "/zstd"
+        self._compressor = zstandard.ZstdCompressor(level=1) if compress else None
+        
+    def _create_sensors(self, num_sensors):
+        """Create a collection of simulated sensors"""
+        sensors = []
+        
+        # Ensure at least one of each important sensor type
+        sensor_types = [
+            SensorType.TEMPERATURE,
+            SensorType.HUMIDITY,
+            SensorType.VOLTAGE,
+            SensorType.CURRENT,
+            SensorType.POWER,
+            SensorType.ENERGY,
+            SensorType.SOLAR_IRRADIANCE,
+            SensorType.WIND_SPEED,
+            SensorType.BATTERY_LEVEL
+        ]
+        
+        # Add core sensor types
+        for i, sensor_type in enumerate(sensor_types):
+            if i >= num_sensors:
+                break
+                
+            sensors.append(self._make_sensor(i, sensor_type))
+        
+        # Add additional random sensors if needed
+        for i in range(len(sensor_types), num_sensors):
+            sensor_type = self._rand.choice(sensor_types)
+            sensors.append(self._make_sensor(i, sensor_type))
+            
+        return sensors
+
+    def _make_sensor(self, index, sensor_type):
+        """Build a sensor description with its topic and payload prefix precomputed"""
+        _, _, scale, unit = SENSOR_SPECS.get(sensor_type, GENERIC_SPEC)
+        sensor = {
+            "id": f"sensor-{index+1}",
+            "type": sensor_type,
+            "location": f"zone-{(index % 3) + 1}",
+            "scale": scale,
+            "unit": unit,
+            "qos": SENSOR_QOS.get(sensor_type, TELEMETRY_QOS),
+        }
+        sensor["_read"] = _compile_reader(
+            self.codec, scale, unit, self._generators.get(sensor_type, self._generic_generator)
+        )
+        sensor["topic"] = self._codec_topic(f"iot/gateway/{self.gateway_id}/sensors/{sensor_type}/{sensor['id']}")
+        sensor["alias"] = self._alias_base + index
+        if self.mqtt_v5:
+            sensor["_alias_properties"] = Properties(PacketTypes.PUBLISH)
+            sensor["_alias_properties"].TopicAlias = sensor["alias"]
+        
+        self._build_sensor_prefixes(sensor)
+        return sensor
+    
+    def _codec_topic(self, topic):
+        """Suffix a topic with the codec name so subscribers can pick the decoder"""
+        if self.codec == PayloadCodec.MSGPACK:
+            return topic + "/msgpack"
+        return topic
+        
+    def _build_payload_templates(self):
+        """Pre-encode the parts of every payload that do not change between ticks"""
+        # Payloads are assembled as prefix + encoded reading + reading suffix, so only the
+        # reading is serialized per tick. Sensor prefixes are built in _build_sensor_prefixes.
+        if self.codec == PayloadCodec.MSGPACK:
+            pack = self._packer.pack
+            self._encode_reading = pack
+            self._reading_suffix = b""
+            # Map entries without the map header, spliced into each sensor message
+            self._gateway_header = pack("gateway_id") + pack(self.gateway_id)
+            self._batch_separator = b""
+            self._batch_suffix = b""
+        else:
+            self._encode_reading = dumps
+            self._reading_suffix = b"}"
+            # The message object left open after the gateway_id member
+            self._gateway_header = dumps({"gateway_id": self.gateway_id})[:-1]
+            self._batch_separator = b","
+            self._batch_suffix = b"]}"
+            
+    def _build_batch_prefix(self):
+        """Pre-encode a batch message up to its first item, once the sensors are created"""
+        if self.codec == PayloadCodec.MSGPACK:
+            self._batch_prefix = (
+                self._packer.pack_map_header(2) + self._gateway_header
+                + self._packer.pack("items") + self._packer.pack_array_header(len(self.sensors))
+            )
+        else:
+            self._batch_prefix = self._gateway_header + b',"items":['
+            
+    def _build_sensor_prefixes(self, sensor):
+        """Pre-encode a sensor's message and batch item up to the reading value"""
+        fields = {
+            "sensor_id": sensor["id"],
+            "sensor_type": sensor["type"],
+            "location": sensor["location"]
+        }
+        if self.codec == PayloadCodec.MSGPACK:
+            pack = self._packer.pack
+            # Strip the fixmap header byte to keep only the packed entries
+            entries = pack(fields)[1:] + pack("reading")
+            sensor["_prefix"] = self._packer.pack_map_header(5) + self._gateway_header + entries
+            sensor["_item_prefix"] = self._packer.pack_map_header(4) + entries
+        else:
+            members = dumps(fields)[1:-1] + b',"reading":'
+            sensor["_prefix"] = self._gateway_header + b"," + members
+            sensor["_item_prefix"] = b"{" + members
+    
+    def _build_sensor_arrays(self):
+        """Lay out sensor ranges as parallel NumPy arrays for vectorized generation"""
+        specs = [SENSOR_SPECS.get(sensor["type"], GENERIC_SPEC) for sensor in self.sensors]
+        self._lo = np.array([spec[0] for spec in specs], dtype=np.int64)
+        self._hi = np.array([spec[1] for spec in specs], dtype=np.int64)
+        self._value_readers = [_compile_reader(self.codec, spec[2], spec[3]) for spec in specs]
+        self._solar = np.array([sensor["type"] == SensorType.SOLAR_IRRADIANCE for sensor in self.sensors])
+        self._values = np.empty(len(self.sensors), dtype=np.int64)
+        self._fill_values = _fill_kernel() if len(self.sensors) >= VECTORIZE_MIN_SENSORS else None
+        
+    @property
+    def client(self):
+        """The MQTT client of the underlying transport"""
+        return self.transport.client
+        
+    @property
+    def connected(self):
+        """Whether the underlying transport is connected to the broker"""
+        return self.transport.connected
+        
+    # The connection methods below act on the transport, so on a shared transport they
+    # connect, run or disconnect every attached gateway, not just this one
+    
+    def connect(self):
+        """Connect the transport to the MQTT broker, a no-op if it is already connected"""
+        return self.transport.connect()
+        
+    def service(self, timeout=0):
+        """Process pending network traffic on the underlying transport"""
+        self.transport.service(timeout)
+        
+    def run(self, interval=5, duration=None):
+        """Run the transport, publishing for all of its gateways, for a duration or indefinitely"""
+        self.transport.run(interval=interval, duration=duration)
+        
+    def disconnect(self):
+        """Disconnect the transport, and so all of its gateways, from the MQTT broker"""
+        self.transport.disconnect()
+        
+    def _sensor_topic(self, sensor):
+        """Topic and publish properties for a sensor, using its topic alias when possible"""
+        if sensor["qos"]:
+            # The persistent session may redeliver QoS 1 messages on a new connection,
+            # where the alias would no longer be bound, so they keep the full topic
+            return sensor["topic"], None
+        return self.transport.aliased_topic(sensor["topic"], sensor["alias"], sensor.get("_alias_properties"))
+        
+    def _timestamp(self):
+        """Current time as ISO 8601 text for JSON, or integer epoch microseconds for msgpack"""
+        if self.codec == PayloadCodec.MSGPACK:
+            return time.time_ns() // 1000
+        return datetime.now().isoformat()
+        
+    def _generate_all_readings(self, timestamp):
+        """Generate readings for all sensors in one vectorized pass over the sensor arrays"""
+        base = _solar_base(datetime.now().hour, SENSOR_SPECS[SensorType.SOLAR_IRRADIANCE][2])
+        # Night is encoded as a negative baseline for the kernel
+        solar_base = -1 if base is None else base
+        
+        if self._fill_values is not None:
+            self._fill_values(self._lo, self._hi, self._solar, solar_base, self._values)
+            values = self._values
+        else:
+            values = self._rng.integers(self._lo, self._hi + 1)
+            if solar_base < 0:
+                values[self._solar] = 0
+            else:
+                values[self._solar] = np.maximum(0, solar_base + values[self._solar])
+                
+        return [read(timestamp, value) for read, value in zip(self._value_readers, values.tolist())]
+        
+    def _generate_readings(self):
+        """Generate one reading per sensor, in the same order as self.sensors"""
+        # All readings of a tick share the same sampling instant
+        timestamp = self._timestamp()
+        if self._rng is not None and len(self.sensors) >= VECTORIZE_MIN_SENSORS:
+            return self._generate_all_readings(timestamp)
+        return [sensor["_read"](timestamp) for sensor in self.sensors]
+        
+    def publish_sensor_data(self):
+        """Publish data for all sensors to the MQTT broker"""
+        # Read acks and keep the connection alive when called outside run()
+        self.transport.service()
+        return self._publish_readings()
+        
+    def _publish_readings(self):
+        """Publish one tick of readings, without servicing the connection"""
+        if not self.connected:
+            logger.error("Not connected to MQTT broker. Cannot publish data.")
+            return False
+            
+        # Checked once per tick so disabled debug logging costs nothing per message
+        log_payloads = logger.isEnabledFor(logging.DEBUG)
+        
+        if self.batch:
+            self._publish_batch(log_payloads)
+            return True
+            
+        # Bind hot lookups once per tick rather than once per sensor
+        publish = self.transport.publish
+        sensor_topic = self._sensor_topic
+        encode_reading = self._encode_reading
+        suffix = self._reading_suffix
+        join = b"".join
+        
+        for sensor, reading in zip(self.sensors, self._generate_readings()):
+            # Only the reading changes between ticks, splice it into the cached prefix
+            # with a single allocation for the final payload
+            payload = join((sensor["_prefix"], encode_reading(reading), suffix))
+            
+            topic, properties = sensor_topic(sensor)
+            publish(topic, payload, sensor["qos"], properties, log_payloads)
+                
+        return True
+        
+    def _publish_batch(self, log_payload=False):
+        """Publish the readings of all sensors as a single message"""
+        encode_reading = self._encode_reading
+        suffix = self._reading_suffix
+        join = b"".join
+        items = [
+            join((sensor["_item_prefix"], encode_reading(reading), suffix))
+            for sensor, reading in zip(self.sensors, self._generate_readings())
+        ]
+        
+        payload = join((self._batch_prefix, self._batch_separator.join(items), self._batch_suffix))
+        topic = self.batch_topic
+        user_properties = [("batch-format", "v1"), ("batch-size", str(len(items)))]
+        
+        if self._compressor is not None and len(payload) > COMPRESS_MIN_BYTES:
+            payload = self._compressor.compress(payload)
+            topic = self.compressed_batch_topic
+            user_properties.append(("content-encoding", "zstd"))
+            
+        properties = None
+        if self.mqtt_v5:
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.UserProperty = user_properties
+            
+        self.transport.publish(topic, payload, DEFAULT_QOS, properties, log_payload)
+        
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(description="IoT Gateway Simulator for Energy Management System")
@@ -261,20 +763,57 @@ def main():
     parser.add_argument("--interval", type=int, default=5, help="Data publishing interval in seconds (default: 5)")
     parser.add_argument("--duration", type=int, help="Duration to run in seconds (default: run indefinitely)")
     parser.add_argument("--sensors", type=int, default=10, help="Number of sensors to simulate (default: 10)")
-    parser.add_argument("--gateway-id", help="Custom gateway ID (default: auto-generated)")
+    parser.add_argument("--gateway-id", help="Custom gateway ID, suffixed with -1, -2, ... when simulating several gateways (default: auto-generated)")
+    parser.add_argument("--gateways", type=int, default=1, help="Number of gateways to simulate over one shared MQTT connection (default: 1)")
+    parser.add_argument("--codec", choices=[PayloadCodec.JSON, PayloadCodec.MSGPACK], default=PayloadCodec.JSON,
+                        help=f"Payload encoding (default: {PayloadCodec.JSON})")
+    parser.add_argument("--batch", action="store_true", help="Publish all readings of a tick as one message")
+    parser.add_argument("--mqtt-v5", action="store_true", help="Connect using MQTT v5 instead of v3.1.1")
+    parser.add_argument("--compress", action="store_true",
+                        help=f"Compress batches larger than {COMPRESS_MIN_BYTES} bytes with zstd (requires --batch)")
     
     args = parser.parse_args()
+    if args.sensors < 0:
+        parser.error("--sensors must not be negative")
+    if args.gateways < 1:
+        parser.error("--gateways must be at least 1")
+    if args.compress and not args.batch:
+        parser.error("--compress requires --batch")
+    if args.compress and zstandard is None:
+        parser.error("--compress requires the 'zstandard' package")
+    if args.codec == PayloadCodec.MSGPACK and msgpack is None:
+        parser.error("--codec msgpack requires the 'msgpack' package")
     
     # Create and run the simulator
-    simulator = IoTGatewaySimulator(
-        broker_host=args.broker_host,
-        broker_port=args.broker_port,
-        num_sensors=args.sensors,
-        gateway_id=args.gateway_id
-    )
-    
-    if simulator.connect():
-        simulator.run(interval=args.interval, duration=args.duration)
+    transport = None
+    if args.gateways > 1:
+        # A fixed --gateway-id gives the fleet a stable client ID, and so a resumable session
+        client_id = f"iot-gateway-fleet-{args.gateway_id}" if args.gateway_id else None
+        transport = SharedMqttTransport(args.broker_host, args.broker_port, client_id=client_id, mqtt_v5=args.mqtt_v5)
+        
+    for i in range(args.gateways):
+        gateway_id = args.gateway_id
+        if gateway_id and args.gateways > 1:
+            gateway_id = f"{gateway_id}-{i+1}"
+            
+        simulator = IoTGatewaySimulator(
+            broker_host=args.broker_host,
+            broker_port=args.broker_port,
+            num_sensors=args.sensors,
+            gateway_id=gateway_id,
+            codec=args.codec,
+            batch=args.batch,
+            mqtt_v5=args.mqtt_v5,
+            transport=transport,
+            compress=args.compress
+        )
+        
+    # With a single gateway the simulator owns its transport
+    if transport is None:
+        transport = simulator.transport
+        
+    if transport.connect():
+        transport.run(interval=args.interval, duration=args.duration)
     else:
         logger.error("Failed to start simulator due to connection issues")
         return 1
@@ -282,5 +821,4 @@ def main():
     return 0
 
 if __name__ == "__main__":
-    import math  # Import needed for solar irradiance calculation
     exit(main())